@@ -1,26 +1,56 @@
-from flask import Flask, render_template, request, jsonify
+import orjson
+from cachetools import TTLCache
+from quart import Quart, render_template, request
 from services.burn_agent import PrescribedBurnAgent
 
-app = Flask(__name__)
+app = Quart(__name__)
 agent = PrescribedBurnAgent()
 
+# Bursts for the same city (users refreshing) short-circuit to cached
+# pre-serialized bytes before the agent pipeline is entered at all
+_VIEW_CACHE = TTLCache(maxsize=1024, ttl=60)
+
+# The one fixed error envelope, serialized once at import time
+_CITY_REQUIRED = orjson.dumps({'error': 'City name is required'})
+
+def ojson(data, status=200):
+    """JSON response via orjson - much faster than jsonify on nested dicts"""
+    return app.response_class(orjson.dumps(data), status=status,
+                              mimetype='application/json')
+
+def _raw_json(body, status=200):
+    """JSON response from already-serialized bytes"""
+    return app.response_class(body, status=status, mimetype='application/json')
+
 @app.route('/')
-def index():
-    return render_template('index.html')
+async def index():
+    return await render_template('index.html')
 
 @app.route('/api/analyze', methods=['POST'])
-def analyze_location():
-    data = request.json
+async def analyze_location():
+    data = await request.get_json()
     city = data.get('city', '')
-    
+
     if not city:
-        return jsonify({'error': 'City name is required'}), 400
-    
+        return _raw_json(_CITY_REQUIRED, status=400)
+
+    key = city.strip().lower()
+    cached = _VIEW_CACHE.get(key)
+    if cached is not None:
+        return _raw_json(cached)
+
     try:
-        result = agent.analyze_location(city)
-        return jsonify(result)
+        result = await agent.analyze_location(city)
+    except ValueError as e:
+        # Geocoding failure - the only error that invalidates the whole
+        # request; subsystem failures come back as partial results instead
+        return ojson({'error': str(e)}, status=404)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojson({'error': str(e)}, status=500)
+
+    body = orjson.dumps(result)
+    _VIEW_CACHE[key] = body
+    return _raw_json(body)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -1,25 +1,84 @@
-import requests
+import asyncio
+import re
+
+import httpx
+import ijson
+from cachetools import LRUCache, TTLCache
 from geopy.geocoders import Nominatim
 from typing import Dict, Any
-import time
+
+from services.cache import (
+    coord_key, ttl_cached, WEATHER_TTL, NWS_GRID_TTL, TOPOGRAPHY_TTL, OSM_TTL
+)
+from services.ratelimit import AsyncRateLimiter
+
+# Tag values that count as burnable fuel; anything else matching the OSM
+# query is treated as a water feature
+FUEL_NATURAL_TAGS = {'wood', 'grassland', 'scrub'}
+FUEL_LANDUSE_TAGS = {'forest', 'grass', 'meadow'}
+
+# NWS wind speeds come as strings like "10 mph" or "5 to 10 mph"
+_WIND_RE = re.compile(r'\d+')
+
+# A hung remote should fail at connect time in seconds, not burn the whole
+# read budget; read allowances differ because Overpass legitimately takes
+# tens of seconds on large queries while NWS/Open-Elevation answer fast
+_FAST_TIMEOUT = httpx.Timeout(7.0, connect=3.05)
+_SLOW_TIMEOUT = httpx.Timeout(25.0, connect=3.05)
+
+# Nominatim's usage policy is 1 req/s; Overpass tolerates a couple of
+# concurrent queries before throttling
+_NOMINATIM_LIMITER = AsyncRateLimiter(max_concurrent=1, min_interval=1.0)
+_OVERPASS_LIMITER = AsyncRateLimiter(max_concurrent=2, min_interval=0.5)
 
 class PrescribedBurnAgent:
     def __init__(self):
         self.geolocator = Nominatim(user_agent="prescribed_burn_agent")
-    
-    def analyze_location(self, city: str) -> Dict[str, Any]:
+        # One shared client for all upstream calls: keep-alive connections
+        # skip the TCP/TLS handshake on every call after the first per host
+        self._client = httpx.AsyncClient(
+            headers={'User-Agent': 'PrescribedBurnAgent/1.0'},
+            timeout=_FAST_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=32),
+            transport=httpx.AsyncHTTPTransport(retries=2)
+        )
+        # NWS /points/ responses map coordinates to forecast URLs that stay
+        # stable for months, and /points/ is the hardest-rate-limited route
+        self._points_cache = TTLCache(maxsize=10_000, ttl=NWS_GRID_TTL)
+        self._geocode_cache = LRUCache(maxsize=4096)
+
+    async def analyze_location(self, city: str) -> Dict[str, Any]:
         """Main orchestration method to gather all burn-relevant data"""
-        
+
         # Step 1: Geocode the city
-        location_data = self._geocode_city(city)
+        location_data = await self._geocode_city(city)
         lat = location_data['latitude']
         lon = location_data['longitude']
-        
-        # Step 2: Gather data from various sources
-        weather_data = self._get_weather_data(lat, lon)
-        topography_data = self._get_topography_data(lat, lon)
-        fuel_data = self._get_fuel_sources(lat, lon)
-        water_sources = self._get_water_sources(lat, lon)
+
+        # Step 2: Gather data from all sources concurrently - the calls are
+        # independent, so total latency is the slowest subsystem, not the sum
+        results = await asyncio.gather(
+            self._get_weather_data(lat, lon),
+            self._get_topography_data(lat, lon),
+            self._get_osm_features(lat, lon),
+            return_exceptions=True
+        )
+
+        # Each fetcher already reports failures as an error dict; anything
+        # that still escaped becomes one too, so a single flaky upstream
+        # degrades its section instead of failing the whole report
+        weather_data, topography_data, osm_data = [
+            {'error': str(r)} if isinstance(r, BaseException) else r
+            for r in results
+        ]
+
+        # The combined OSM fetch serves both report sections
+        if 'error' not in osm_data:
+            fuel_data = osm_data['fuel_sources']
+            water_sources = osm_data['water_sources']
+        else:
+            fuel_data = osm_data
+            water_sources = osm_data
         
         # Step 3: Compile comprehensive report
         return {
@@ -31,8 +90,29 @@ class PrescribedBurnAgent:
             'burn_assessment': self._assess_burn_conditions(weather_data)
         }
     
-    def _geocode_city(self, city: str) -> Dict[str, Any]:
+    async def _geocode_city(self, city: str) -> Dict[str, Any]:
         """Convert city name to coordinates"""
+        # Normalize so "Boise", "boise " and "BOISE" share one cache slot;
+        # geocode results are stable for days, so an unbounded TTL is fine
+        key = city.strip().lower()
+        cached = self._geocode_cache.get(key)
+        if cached is not None:
+            return cached
+
+        async with _NOMINATIM_LIMITER:
+            # Re-check after the wait: a concurrent request for the same
+            # city may have populated the cache while we queued
+            cached = self._geocode_cache.get(key)
+            if cached is not None:
+                return cached
+            # geopy's transport is blocking, so run it off the event loop -
+            # one slow Nominatim call must not stall other in-flight requests
+            result = await asyncio.to_thread(self._geocode_city_uncached, key)
+
+        self._geocode_cache[key] = result
+        return result
+
+    def _geocode_city_uncached(self, city: str) -> Dict[str, Any]:
         location = self.geolocator.geocode(city)
         if not location:
             raise ValueError(f"Could not find location: {city}")
@@ -44,79 +124,67 @@ class PrescribedBurnAgent:
             'longitude': location.longitude
         }
     
-    def _get_weather_data(self, lat: float, lon: float) -> Dict[str, Any]:
+    @ttl_cached(maxsize=1024, ttl=WEATHER_TTL)
+    async def _get_weather_data(self, lat: float, lon: float) -> Dict[str, Any]:
         """Fetch weather data from National Weather Service"""
         try:
-            # Get grid point
-            points_url = f"https://api.weather.gov/points/{lat},{lon}"
-            headers = {'User-Agent': 'PrescribedBurnAgent/1.0'}
-            
-            response = requests.get(points_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            points_data = response.json()
-            
+            # Resolve the grid point, preferring the cached forecast URLs
+            grid_key = coord_key(lat, lon)
+            grid_urls = self._points_cache.get(grid_key)
+            if grid_urls is None:
+                points_url = f"https://api.weather.gov/points/{lat},{lon}"
+                response = await self._client.get(points_url)
+                response.raise_for_status()
+                points_data = response.json()
+                grid_urls = (
+                    points_data['properties']['forecast'],
+                    points_data['properties']['forecastHourly']
+                )
+                self._points_cache[grid_key] = grid_urls
+
             # Get both regular forecast and hourly forecast for humidity data
-            forecast_url = points_data['properties']['forecast']
-            hourly_forecast_url = points_data['properties']['forecastHourly']
-            
-            forecast_response = requests.get(forecast_url, headers=headers, timeout=10)
+            forecast_url, hourly_forecast_url = grid_urls
+
+            forecast_response = await self._client.get(forecast_url)
             forecast_response.raise_for_status()
             forecast_data = forecast_response.json()
-            
-            # Get hourly forecast for humidity
-            hourly_response = requests.get(hourly_forecast_url, headers=headers, timeout=10)
-            hourly_response.raise_for_status()
-            hourly_data = hourly_response.json()
-            
+
             periods = forecast_data['properties']['periods'][:3]  # Next 3 periods
-            hourly_periods = hourly_data['properties']['periods']
+
+            # Modern NWS responses carry relativeHumidity in each period, so
+            # only pay for the (large) hourly payload when one is missing
+            hourly_periods = []
+            if any(self._period_humidity(p) is None for p in periods):
+                hourly_response = await self._client.get(hourly_forecast_url)
+                hourly_response.raise_for_status()
+                hourly_data = hourly_response.json()
+                hourly_periods = hourly_data['properties']['periods']
             
-            # Normalize period names to Today/Tonight/Tomorrow and get humidity
+            # Normalize period names to Today/Tonight/Tomorrow and get humidity.
+            # The whole sequence is determined by whether NWS starts the
+            # forecast on a day or night period, so pick the name list once
+            # instead of back-referencing into the list being built
+            if periods and 'night' in periods[0]['name'].lower():
+                names = ('Tonight', 'Tomorrow', 'Tomorrow Night')
+            else:
+                names = ('Today', 'Tonight', 'Tomorrow')
+
             normalized_periods = []
             for i, p in enumerate(periods):
                 original_name = p['name']
-                
-                # Determine normalized name based on position and original name
-                if i == 0:
-                    # First period - check if it's a night period
-                    if 'night' in original_name.lower():
-                        normalized_name = 'Tonight'
-                    else:
-                        normalized_name = 'Today'
-                elif i == 1:
-                    # Second period - usually the opposite of first (day/night)
-                    if normalized_periods[0]['name'] == 'Today':
-                        normalized_name = 'Tonight'
-                    else:
-                        normalized_name = 'Tomorrow'
-                else:
-                    # Third period
-                    if normalized_periods[1]['name'] == 'Tonight':
-                        normalized_name = 'Tomorrow'
-                    else:
-                        normalized_name = 'Tomorrow Night'
-                
+                normalized_name = names[i]
+
                 # Try to get humidity from the period itself first
-                humidity = None
-                if 'relativeHumidity' in p and p['relativeHumidity']:
-                    if isinstance(p['relativeHumidity'], dict):
-                        humidity = p['relativeHumidity'].get('value')
-                    else:
-                        humidity = p['relativeHumidity']
-                
+                humidity = self._period_humidity(p)
+
                 # If not found, try to match with hourly forecast (use corresponding hours)
                 if humidity is None and hourly_periods:
                     # Use hourly periods that correspond to this forecast period
                     start_idx = i * 4  # Approximate: each 12-hour period = ~4 hourly periods
                     for hourly in hourly_periods[start_idx:start_idx + 4]:
-                        if hourly.get('relativeHumidity'):
-                            humidity_data = hourly['relativeHumidity']
-                            if isinstance(humidity_data, dict):
-                                humidity = humidity_data.get('value')
-                            else:
-                                humidity = humidity_data
-                            if humidity is not None:
-                                break
+                        humidity = self._period_humidity(hourly)
+                        if humidity is not None:
+                            break
                 
                 normalized_periods.append({
                     'name': normalized_name,
@@ -137,33 +205,42 @@ class PrescribedBurnAgent:
         except Exception as e:
             return {'error': f"Weather data unavailable: {str(e)}"}
 
-    def _get_topography_data(self, lat: float, lon: float) -> Dict[str, Any]:
+    @staticmethod
+    def _period_humidity(period: Dict[str, Any]):
+        """Extract the relative humidity value from a forecast period, if any"""
+        humidity_data = period.get('relativeHumidity')
+        if not humidity_data:
+            return None
+        if isinstance(humidity_data, dict):
+            return humidity_data.get('value')
+        return humidity_data
+
+    @ttl_cached(maxsize=1024, ttl=TOPOGRAPHY_TTL)
+    async def _get_topography_data(self, lat: float, lon: float) -> Dict[str, Any]:
         """Fetch elevation and topography data"""
         try:
-            url = f"https://api.open-elevation.com/api/v1/lookup?locations={lat},{lon}"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            elevation = data['results'][0]['elevation']
-            
-            # Sample nearby points for slope calculation
+            # Center point plus 4 nearby samples for slope calculation -
+            # the locations= parameter takes a pipe-separated list, so one
+            # request covers all five points
             offset = 0.01  # roughly 1km
-            nearby_points = [
+            all_points = [
+                (lat, lon),
                 (lat + offset, lon),
                 (lat - offset, lon),
                 (lat, lon + offset),
                 (lat, lon - offset)
             ]
-            
-            locations_str = '|'.join([f"{p[0]},{p[1]}" for p in nearby_points])
-            nearby_url = f"https://api.open-elevation.com/api/v1/lookup?locations={locations_str}"
-            nearby_response = requests.get(nearby_url, timeout=10)
-            nearby_data = nearby_response.json()
-            
-            elevations = [r['elevation'] for r in nearby_data['results']]
+
+            locations_str = '|'.join([f"{p[0]},{p[1]}" for p in all_points])
+            url = f"https://api.open-elevation.com/api/v1/lookup?locations={locations_str}"
+            response = await self._client.get(url)
+            response.raise_for_status()
+            data = response.json()
+
+            elevation = data['results'][0]['elevation']
+            elevations = [r['elevation'] for r in data['results'][1:]]
             elevation_range = max(elevations) - min(elevations)
-            
+
             return {
                 'source': 'Open-Elevation API (SRTM 2000)',
                 'elevation_meters': elevation,
@@ -185,12 +262,14 @@ class PrescribedBurnAgent:
         else:
             return "Steep/mountainous terrain"
     
-    def _get_fuel_sources(self, lat: float, lon: float) -> Dict[str, Any]:
-        """Query OpenStreetMap for vegetation and land use"""
+    @ttl_cached(maxsize=1024, ttl=OSM_TTL)
+    async def _get_osm_features(self, lat: float, lon: float) -> Dict[str, Any]:
+        """Query OpenStreetMap for fuel (vegetation/land use) and water sources"""
         try:
             overpass_url = "http://overpass-api.de/api/interpreter"
-            
-            # Query for natural features and land use within 5km radius
+
+            # One combined query for both layers: vegetation and hydrants
+            # within 5km, water bodies within 10km
             query = f"""
             [out:json];
             (
@@ -200,79 +279,83 @@ class PrescribedBurnAgent:
               way["landuse"="meadow"](around:5000,{lat},{lon});
               way["natural"="grassland"](around:5000,{lat},{lon});
               way["natural"="scrub"](around:5000,{lat},{lon});
-            );
-            out body;
-            >;
-            out skel qt;
-            """
-            
-            response = requests.get(overpass_url, params={'data': query}, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Categorize fuel types
-            fuel_types = {}
-            for element in data.get('elements', []):
-                if element['type'] == 'way':
-                    tags = element.get('tags', {})
-                    fuel_type = tags.get('natural') or tags.get('landuse')
-                    if fuel_type:
-                        fuel_types[fuel_type] = fuel_types.get(fuel_type, 0) + 1
-            
-            return {
-                'source': 'OpenStreetMap via Overpass API',
-                'fuel_types_found': fuel_types,
-                'total_areas': len([e for e in data.get('elements', []) if e['type'] == 'way']),
-                'dominant_fuel': max(fuel_types.items(), key=lambda x: x[1])[0] if fuel_types else 'Unknown'
-            }
-        except Exception as e:
-            return {'error': f"Fuel source data unavailable: {str(e)}"}
-    
-    def _get_water_sources(self, lat: float, lon: float) -> Dict[str, Any]:
-        """Find nearby water sources from OpenStreetMap"""
-        try:
-            overpass_url = "http://overpass-api.de/api/interpreter"
-            
-            # Query for water sources within 10km
-            query = f"""
-            [out:json];
-            (
               way["natural"="water"](around:10000,{lat},{lon});
               way["waterway"](around:10000,{lat},{lon});
               node["emergency"="fire_hydrant"](around:5000,{lat},{lon});
               way["landuse"="reservoir"](around:10000,{lat},{lon});
             );
-            out body;
-            >;
-            out skel qt;
+            out tags;
             """
-            
-            response = requests.get(overpass_url, params={'data': query}, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            
+
+            # Split elements between the fuel and water layers in one pass
+            fuel_types = {}
+            total_areas = 0
+            dominant_fuel = 'Unknown'
+            dominant_count = 0
             water_types = {}
+            water_bodies = 0
             hydrants = 0
-            
-            for element in data.get('elements', []):
+
+            def tally(element):
+                nonlocal total_areas, dominant_fuel, dominant_count, water_bodies, hydrants
                 tags = element.get('tags', {})
-                
+                if not tags:
+                    return
+
                 if tags.get('emergency') == 'fire_hydrant':
                     hydrants += 1
+                    return
+
+                natural = tags.get('natural')
+                landuse = tags.get('landuse')
+                if natural in FUEL_NATURAL_TAGS or landuse in FUEL_LANDUSE_TAGS:
+                    fuel_type = natural or landuse
+                    count = fuel_types.get(fuel_type, 0) + 1
+                    fuel_types[fuel_type] = count
+                    total_areas += 1
+                    if count > dominant_count:
+                        dominant_fuel = fuel_type
+                        dominant_count = count
                 else:
-                    water_type = tags.get('natural') or tags.get('waterway') or tags.get('landuse')
+                    water_type = natural or tags.get('waterway') or landuse
                     if water_type:
                         water_types[water_type] = water_types.get(water_type, 0) + 1
-            
+                        water_bodies += 1
+
+            # Stream-parse the payload, tallying elements as chunks arrive
+            # instead of materializing the full multi-megabyte element list.
+            # POST avoids URL length limits for the long query body.
+            elements = ijson.sendable_list()
+            parser = ijson.items_coro(elements, 'elements.item')
+            async with _OVERPASS_LIMITER:
+                async with self._client.stream('POST', overpass_url,
+                                               data={'data': query},
+                                               timeout=_SLOW_TIMEOUT) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        parser.send(chunk)
+                        for element in elements:
+                            tally(element)
+                        del elements[:]
+            parser.close()
+
             return {
-                'source': 'OpenStreetMap via Overpass API',
-                'water_bodies': water_types,
-                'fire_hydrants': hydrants,
-                'total_water_sources': len(data.get('elements', []))
+                'fuel_sources': {
+                    'source': 'OpenStreetMap via Overpass API',
+                    'fuel_types_found': fuel_types,
+                    'total_areas': total_areas,
+                    'dominant_fuel': dominant_fuel
+                },
+                'water_sources': {
+                    'source': 'OpenStreetMap via Overpass API',
+                    'water_bodies': water_types,
+                    'fire_hydrants': hydrants,
+                    'total_water_sources': hydrants + water_bodies
+                }
             }
         except Exception as e:
-            return {'error': f"Water source data unavailable: {str(e)}"}
-    
+            return {'error': f"OpenStreetMap data unavailable: {str(e)}"}
+
     def _assess_burn_conditions(self, weather_data: Dict[str, Any]) -> Dict[str, Any]:
         """Provide basic burn condition assessment based on weather"""
         if 'error' in weather_data:
@@ -286,8 +369,10 @@ class PrescribedBurnAgent:
             
             concerns = []
             
-            # Parse wind speed (format like "10 mph" or "5 to 10 mph")
-            wind_value = int(''.join(filter(str.isdigit, wind.split()[0])))
+            # Parse wind speed, taking the top of a range like "5 to 10 mph"
+            # so a gusty forecast gets the conservative assessment
+            wind_numbers = _WIND_RE.findall(wind)
+            wind_value = max(map(int, wind_numbers)) if wind_numbers else 0
             
             if wind_value > 15:
                 concerns.append("High wind speeds - increased fire spread risk")
@@ -0,0 +1,36 @@
+from functools import wraps
+
+from cachetools import TTLCache
+
+# TTLs tuned to how quickly each data source actually changes
+WEATHER_TTL = 10 * 60          # forecasts refresh on the order of minutes
+NWS_GRID_TTL = 7 * 24 * 3600   # grid point -> forecast URLs are stable for months
+TOPOGRAPHY_TTL = 30 * 24 * 3600  # SRTM elevation data is static
+OSM_TTL = 7 * 24 * 3600        # land use / water features change slowly
+
+def coord_key(lat: float, lon: float) -> tuple:
+    """Collapse nearby coordinates onto one cache key (~100m at 3 decimals)"""
+    return (round(lat, 3), round(lon, 3))
+
+def ttl_cached(maxsize: int, ttl: float):
+    """Cache an async fetcher's parsed result keyed by coarse lat/lon.
+
+    Only successful results are stored - error dicts fall through so a
+    transient upstream failure is retried on the next request.
+    """
+    cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, lat: float, lon: float):
+            key = coord_key(lat, lon)
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            result = await func(self, lat, lon)
+            if isinstance(result, dict) and 'error' not in result:
+                cache[key] = result
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+class AsyncRateLimiter:
+    """Bound concurrency and enforce a minimum delay between requests.
+
+    Public endpoints like Nominatim (1 req/s) and Overpass throttle hard
+    when hit in bursts; a small deterministic wait here is far cheaper
+    than the multi-second 429 backoffs (or IP bans) it prevents. Limits
+    apply per process and complement the response caches.
+    """
+
+    def __init__(self, max_concurrent: int, min_interval: float):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._min_interval = min_interval
+        self._last_request = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        async with self._lock:
+            wait = self._min_interval - (time.monotonic() - self._last_request)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()